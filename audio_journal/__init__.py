@@ -1,3 +1,4 @@
+import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
@@ -6,6 +7,10 @@ from flask_login import LoginManager
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'e67ae8f223b0369f25088993849e8560'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
+app.config['AUDIO_FOLDER'] = os.path.join(app.instance_path, 'audio')
+app.config['AUDIO_SEGMENT_SECONDS'] = 10
+app.config['AUDIO_PROCESS_TIMEOUT'] = 120
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 db = SQLAlchemy(app)
 bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
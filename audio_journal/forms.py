@@ -127,9 +127,11 @@ class PostForm(FlaskForm):
     Attributes:
     - title (StringField): Field for entering the post's title.
     - content (TextAreaField): Field for entering the post's content.
+    - audio (FileField): Field carrying the recording captured in the browser.
     - submit (SubmitField): Button to submit the post form.
       Label: 'Post'
     """
     title = StringField('Title', validators=[DataRequired()])
     content = TextAreaField('Content', validators=[DataRequired()])
+    audio = FileField('Recording', validators=[FileAllowed(['ogg', 'opus', 'webm', 'm4a', 'mp4'])])
     submit = SubmitField('Post')
@@ -63,6 +63,8 @@ class Post(db.Model):
     - title (str): Title of the post (maximum length: 100 characters).
     - date_posted (datetime): Date and time when the post was created.
     - content (str): Content of the post.
+    - audio_data (str): Name of the directory holding the post's segmented recording
+      and its manifest, or None if the post has no audio.
     - user_id (int): Foreign key referencing the 'id' of the User who authored the post.
 
     Methods:
@@ -76,6 +78,7 @@ class Post(db.Model):
     date_posted = db.Column(db.DateTime, nullable=False,
                             default=datetime.utcnow)
     content = db.Column(db.Text, nullable=False)
+    audio_data = db.Column(db.String(255), nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
     def __repr__(self):
@@ -1,7 +1,12 @@
 import os
+import json
 import secrets
+import shutil
+import subprocess
+import threading
+import time
 from PIL import Image
-from flask import render_template, url_for, flash, redirect, request, abort
+from flask import render_template, url_for, flash, redirect, request, abort, jsonify, send_from_directory
 from audio_journal import app, db, bcrypt
 from audio_journal.forms import RegistrationForm, LoginForm, UpdateAccountForm, PostForm
 from audio_journal.models import User, Post
@@ -126,6 +131,176 @@ def save_picture(form_picture):
     return picture_fname
 
 
+def save_audio(form_audio):
+    """
+    Save a recording uploaded through a form so it can be segmented in the background.
+
+    Parameters:
+    - form_audio (FileStorage): The uploaded file holding the recorded audio.
+
+    Returns:
+    audio_dir: The name of the new directory holding the upload, to be passed to
+    process_post_audio, or None if the upload could not be stored.
+    """
+    # Generate a random directory name for the new recording
+    random_hex = secrets.token_hex(8)
+    _, f_ext = os.path.splitext(form_audio.filename)
+    audio_path = os.path.join(app.config['AUDIO_FOLDER'], random_hex)
+    try:
+        os.makedirs(audio_path)
+        form_audio.save(os.path.join(audio_path, 'source' + f_ext))
+    except OSError:
+        shutil.rmtree(audio_path, ignore_errors=True)
+        return None
+    return random_hex
+
+
+def segment_audio(audio_dir):
+    """
+    Split a saved recording into fixed-duration Opus segments.
+
+    ffmpeg decodes the recording to 48 kHz mono PCM on its stdout. Each AUDIO_SEGMENT_SECONDS
+    slice read from it is encoded by its own ffmpeg run into a standalone Ogg/Opus file.
+    Players can therefore start after the first segment arrives, and seeking only has to
+    download the segments it lands in. Because each segment has its own encoder, the Opus
+    pre-skip only drops that encoder's priming samples, so segments played back to back
+    reproduce the recording without losing audio at the boundaries. A 'manifest.json' index
+    listing every segment with its start time and duration is written next to them.
+
+    ffmpeg only accepts the container formats browsers record into (Ogg, WebM, MP4), reads
+    nothing but the uploaded file, and all runs together are killed after
+    AUDIO_PROCESS_TIMEOUT seconds.
+
+    Parameters:
+    - audio_dir (str): The directory name returned by save_audio.
+
+    Returns:
+    bool: True if the segments and manifest were written. On failure the directory is removed.
+    """
+    audio_path = os.path.join(app.config['AUDIO_FOLDER'], audio_dir)
+    segment_seconds = app.config['AUDIO_SEGMENT_SECONDS']
+    deadline = time.monotonic() + app.config['AUDIO_PROCESS_TIMEOUT']
+    frame_rate, frame_size = 48000, 2
+    encode_command = [
+        'ffmpeg', '-loglevel', 'error', '-protocol_whitelist', 'pipe',
+        '-f', 's16le', '-ac', '1', '-ar', str(frame_rate), '-i', 'pipe:0',
+        '-c:a', 'libopus', '-b:a', '48k', '-f', 'ogg',
+    ]
+    try:
+        source_path = os.path.join(audio_path, next(
+            name for name in os.listdir(audio_path) if name.startswith('source')))
+        decode_command = [
+            'ffmpeg', '-loglevel', 'error',
+            '-format_whitelist', 'ogg,matroska,mov', '-protocol_whitelist', 'file',
+            '-i', source_path, '-vn', '-ac', '1', '-ar', str(frame_rate),
+            '-f', 's16le', 'pipe:1',
+        ]
+        decoder = subprocess.Popen(decode_command, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL)
+        # Reading stdout blocks, so a stuck decoder is killed from a timer instead
+        watchdog = threading.Timer(deadline - time.monotonic(), decoder.kill)
+        watchdog.start()
+        try:
+            # Encode each slice of the decoded PCM as its own segment
+            segments = []
+            while True:
+                frames = decoder.stdout.read(segment_seconds * frame_rate * frame_size)
+                if not frames:
+                    break
+                filename = 'segment_%03d.opus' % len(segments)
+                subprocess.run(encode_command + [os.path.join(audio_path, filename)],
+                               input=frames, check=True, capture_output=True,
+                               timeout=deadline - time.monotonic())
+                segments.append({
+                    'file': filename,
+                    'start': len(segments) * segment_seconds,
+                    'duration': round(len(frames) / frame_size / frame_rate, 3),
+                })
+        except BaseException:
+            decoder.kill()
+            decoder.wait()
+            raise
+        finally:
+            watchdog.cancel()
+            decoder.stdout.close()
+        try:
+            returncode = decoder.wait(timeout=max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            decoder.kill()
+            decoder.wait()
+            raise
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, decode_command)
+        if not segments:
+            raise ValueError('the recording contains no audio')
+        manifest = {
+            'segment_duration': segment_seconds,
+            'duration': round(segments[-1]['start'] + segments[-1]['duration'], 3),
+            'segments': segments,
+        }
+        with open(os.path.join(audio_path, 'manifest.json'), 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+
+        os.remove(source_path)
+    except (OSError, ValueError, StopIteration,
+            subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        shutil.rmtree(audio_path, ignore_errors=True)
+        return False
+    return True
+
+
+def delete_audio(audio_dir):
+    """
+    Remove a post's segmented recording from disk.
+
+    Parameters:
+    - audio_dir (str): The directory name returned by save_audio, or None.
+    """
+    if audio_dir:
+        shutil.rmtree(os.path.join(app.config['AUDIO_FOLDER'], audio_dir), ignore_errors=True)
+
+
+def process_post_audio(post_id, audio_dir):
+    """
+    Segment a saved recording and attach it to its post, replacing any previous recording.
+
+    Runs in a background thread started once the post is committed, so a long encode
+    never holds up the request or puts the post at risk. If segmenting fails, or the
+    post was deleted in the meantime, the recording is discarded.
+
+    Parameters:
+    - post_id (int): The unique identifier of the post the recording belongs to.
+    - audio_dir (str): The directory name returned by save_audio.
+    """
+    with app.app_context():
+        if not segment_audio(audio_dir):
+            return
+        post = db.session.get(Post, post_id)
+        if post is None:
+            delete_audio(audio_dir)
+            return
+        old_audio = post.audio_data
+        post.audio_data = audio_dir
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            delete_audio(audio_dir)
+            raise
+        delete_audio(old_audio)
+
+
+def start_audio_processing(post_id, audio_dir):
+    """
+    Start process_post_audio for a freshly saved recording in a background thread.
+
+    Parameters:
+    - post_id (int): The unique identifier of the post the recording belongs to.
+    - audio_dir (str): The directory name returned by save_audio.
+    """
+    threading.Thread(target=process_post_audio, args=(post_id, audio_dir), daemon=True).start()
+
+
 @app.route("/account", methods=['GET', 'POST'])
 @login_required
 def account():
@@ -170,6 +345,8 @@ def new_post():
     - GET: Renders the 'create_post.html' template with the post creation form for display.
     - POST: Processes the submitted form for creating a new post.
       If successful, creates a new post with the provided information, including optional audio data.
+      An attached recording is split into segments for progressive playback in the
+      background and appears on the post once it is ready.
       Redirects to the home page upon successful post creation.
 
     Returns:
@@ -180,9 +357,22 @@ def new_post():
     form = PostForm()
     if form.validate_on_submit():
         post = Post(title=form.title.data, content=form.content.data, author=current_user)
-        
+        audio_dir = None
+        if form.audio.data:
+            audio_dir = save_audio(form.audio.data)
+            if not audio_dir:
+                flash('Your recording could not be saved and was not attached.', 'warning')
         db.session.add(post)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except Exception:
+            # The recording was written before the commit; don't leave it orphaned
+            db.session.rollback()
+            delete_audio(audio_dir)
+            raise
+        if audio_dir:
+            start_audio_processing(post.id, audio_dir)
+            flash('Your recording is being processed and will appear on the post shortly.', 'info')
         flash('Your post has been created!', 'success')
         return redirect(url_for('home'))
     return render_template("create_post.html", title="New Post", form=form, legend='New Post')
@@ -203,6 +393,56 @@ def post(post_id):
     return render_template("post.html", title=post.title, post=post)
 
 
+@app.route("/post/<int:post_id>/audio")
+def audio_manifest(post_id):
+    """
+    Route handler for the segment manifest of a post's recording.
+
+    Parameters:
+    - post_id (int): The unique identifier of the post whose recording is requested.
+
+    Returns:
+    jsonify: The manifest listing the total duration and, for every segment, its start time,
+    duration and the URL it can be fetched from. Aborts with 404 if the post has no audio
+    or its manifest is missing or unreadable.
+    """
+    post = Post.query.get_or_404(post_id)
+    if not post.audio_data:
+        abort(404)
+    manifest_path = os.path.join(app.config['AUDIO_FOLDER'], post.audio_data, 'manifest.json')
+    try:
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        abort(404)
+    for segment in manifest['segments']:
+        segment['url'] = url_for('audio_segment', post_id=post.id,
+                                 audio_dir=post.audio_data, filename=segment.pop('file'))
+    return jsonify(manifest)
+
+
+@app.route("/post/<int:post_id>/audio/<string:audio_dir>/<string:filename>")
+def audio_segment(post_id, audio_dir, filename):
+    """
+    Route handler for a single Opus segment of a post's recording.
+
+    Parameters:
+    - post_id (int): The unique identifier of the post the segment belongs to.
+    - audio_dir (str): The recording directory, so segments of a replaced recording
+      are never served from cache under the new one.
+    - filename (str): The segment file name as listed in the manifest.
+
+    Returns:
+    send_from_directory: The segment as 'audio/ogg'. Segments never change once written,
+    so they are marked cacheable for a year.
+    """
+    post = Post.query.get_or_404(post_id)
+    if post.audio_data != audio_dir or not filename.endswith('.opus'):
+        abort(404)
+    return send_from_directory(os.path.join(app.config['AUDIO_FOLDER'], audio_dir), filename,
+                               mimetype='audio/ogg', max_age=31536000)
+
+
 @app.route("/post/<int:post_id>/update", methods=['GET', 'POST'])
 @login_required
 def update_post(post_id):
@@ -216,6 +456,8 @@ def update_post(post_id):
     - GET: Renders the 'create_post.html' template with the post update form for display.
     - POST: Processes the submitted form for updating an existing post.
       If successful, updates the post with the provided information, including optional audio data.
+      A newly attached recording is segmented in the background and replaces the
+      previous one once it is ready.
       Redirects to the updated post page upon successful update.
 
     Returns:
@@ -229,7 +471,20 @@ def update_post(post_id):
     if form.validate_on_submit():
         post.title = form.title.data
         post.content = form.content.data
-        db.session.commit()
+        new_audio = None
+        if form.audio.data:
+            new_audio = save_audio(form.audio.data)
+            if not new_audio:
+                flash('Your recording could not be saved and was not attached.', 'warning')
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            delete_audio(new_audio)
+            raise
+        if new_audio:
+            start_audio_processing(post.id, new_audio)
+            flash('Your recording is being processed and will replace the current one shortly.', 'info')
         flash('Your post has been updated!', 'success')
         return redirect(url_for('post', post_id=post.id))
     elif request.method == 'GET':
@@ -249,7 +504,8 @@ def delete_post(post_id):
 
     Methods:
     - POST: Processes the deletion request for an existing post.
-      If the user is the author of the post, deletes the post from the database.
+      If the user is the author of the post, deletes the post from the database
+      along with its recording.
       Redirects to the home page upon successful deletion.
 
     Returns:
@@ -260,6 +516,7 @@ def delete_post(post_id):
         abort(403)
     db.session.delete(post)
     db.session.commit()
+    delete_audio(post.audio_data)
     flash('Your post has been deleted!', 'success')
     return redirect(url_for('home'))
 
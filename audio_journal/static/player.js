@@ -0,0 +1,266 @@
+// Segmented player: plays a post's recording one Opus segment at a time,
+// downloading each segment only when it is needed and prefetching one ahead.
+// Segments are decoded with Web Audio and scheduled back to back, so there is
+// no gap when one segment hands over to the next.
+document.addEventListener('DOMContentLoaded', function () {
+    const wrapper = document.getElementById('segmented-player');
+    if (!wrapper) {
+        return;
+    }
+    const toggleButton = wrapper.querySelector('[data-player-toggle]');
+    const seekBar = wrapper.querySelector('[data-player-seek]');
+    const timeLabel = wrapper.querySelector('[data-player-time]');
+    const errorLabel = wrapper.querySelector('[data-player-error]');
+
+    let context = null, manifest = null, playing = false, seeking = false;
+    // Bumped on every play, pause and seek so late downloads of an older run are ignored
+    let generation = 0;
+    // Position to show and start from while paused or while the first segment downloads
+    let resumePosition = 0;
+    // Once audio is scheduled: at context time `anchor` the recording was at `anchorPosition`,
+    // and scheduled audio runs out at context time `chainEnd`
+    let anchor = null, anchorPosition = 0, chainEnd = 0;
+    // Scheduled sources not yet ended, the next segment to schedule and its start offset
+    let sources = [], nextIndex = 0, nextOffset = 0, queuedRun = null;
+    // Segment index -> promise of the decoded AudioBuffer
+    const cache = new Map();
+
+    const getContext = () => {
+        if (!context) {
+            context = new (window.AudioContext || window.webkitAudioContext)();
+        }
+        return context;
+    };
+
+    // Older WebKit only supports the callback form of decodeAudioData, so use that everywhere
+    const decode = (data) => new Promise((resolve, reject) => {
+        getContext().decodeAudioData(data, resolve, error => {
+            reject(error || new Error('The segment could not be decoded'));
+        });
+    });
+
+    const formatTime = (seconds) => {
+        const minutes = Math.floor(seconds / 60);
+        const rest = Math.floor(seconds % 60);
+        return minutes + ':' + String(rest).padStart(2, '0');
+    };
+
+    // Position in the whole recording, derived only from audio that is actually scheduled
+    const position = () => {
+        if (!playing || anchor === null) {
+            return resumePosition;
+        }
+        const played = Math.min(context.currentTime, chainEnd) - anchor;
+        return Math.min(anchorPosition + played, manifest.duration);
+    };
+
+    const updateTime = () => {
+        if (!manifest) {
+            return;
+        }
+        if (!seeking) {
+            seekBar.value = position();
+        }
+        timeLabel.textContent = formatTime(position()) + ' / ' + formatTime(manifest.duration);
+    };
+
+    // Find the segment covering a point in time of the whole recording
+    const segmentAt = (time) => {
+        const segments = manifest.segments;
+        let index = segments.length - 1;
+        while (index > 0 && segments[index].start > time) {
+            index--;
+        }
+        return index;
+    };
+
+    const fetchSegment = (index) => {
+        if (!cache.has(index)) {
+            const request = fetch(manifest.segments[index].url)
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error('Segment ' + index + ' failed with ' + response.status);
+                    }
+                    return response.arrayBuffer();
+                })
+                .then(decode);
+            request.catch(() => {
+                if (cache.get(index) === request) {
+                    cache.delete(index);
+                }
+            });
+            cache.set(index, request);
+        }
+        return cache.get(index);
+    };
+
+    // Keep only the segment being played and the one after it in memory
+    const evict = () => {
+        const playingIndex = nextIndex - sources.length;
+        cache.forEach((request, index) => {
+            if (index < playingIndex || index > nextIndex) {
+                cache.delete(index);
+            }
+        });
+    };
+
+    const setPlaying = (value) => {
+        playing = value;
+        toggleButton.textContent = playing ? 'Pause' : 'Play';
+    };
+
+    const stopSources = () => {
+        generation++;
+        sources.forEach(source => {
+            source.onended = null;
+            source.stop();
+        });
+        sources = [];
+    };
+
+    const schedule = (run, buffer, offset) => {
+        const now = context.currentTime;
+        if (anchor === null) {
+            anchorPosition = resumePosition;
+            anchor = chainEnd = now;
+        } else if (chainEnd < now) {
+            // The download stalled and playback ran dry: continue from where the audio stopped
+            anchorPosition += chainEnd - anchor;
+            anchor = chainEnd = now;
+        }
+        const source = context.createBufferSource();
+        source.buffer = buffer;
+        source.connect(context.destination);
+        source.start(chainEnd, offset);
+        chainEnd += buffer.duration - offset;
+        sources.push(source);
+
+        source.onended = () => {
+            if (run !== generation) {
+                return;
+            }
+            sources = sources.filter(s => s !== source);
+            if (!sources.length && nextIndex >= manifest.segments.length) {
+                // Reached the end of the recording
+                stopSources();
+                resumePosition = 0;
+                setPlaying(false);
+                updateTime();
+                return;
+            }
+            fill(run);
+        };
+    };
+
+    // Keep one segment scheduled beyond the one that is playing
+    const fill = (run) => {
+        if (queuedRun === run || sources.length > 1 || nextIndex >= manifest.segments.length) {
+            return;
+        }
+        const index = nextIndex;
+        queuedRun = run;
+        fetchSegment(index).then(buffer => {
+            if (queuedRun === run) {
+                queuedRun = null;
+            }
+            if (run !== generation) {
+                return;
+            }
+            schedule(run, buffer, nextOffset);
+            nextIndex = index + 1;
+            nextOffset = 0;
+            evict();
+            fill(run);
+        }).catch(error => {
+            if (queuedRun === run) {
+                queuedRun = null;
+            }
+            console.log('Following error has occurred: ', error);
+            if (run === generation && !sources.length) {
+                // Nothing left to play: stop where the audio ended so Play retries from there
+                resumePosition = position();
+                stopSources();
+                setPlaying(false);
+                updateTime();
+                errorLabel.textContent = 'The recording could not be loaded. Press Play to try again.';
+            }
+        });
+    };
+
+    const start = (time) => {
+        stopSources();
+        const index = segmentAt(time);
+        resumePosition = time;
+        anchor = null;
+        nextIndex = index;
+        nextOffset = time - manifest.segments[index].start;
+        errorLabel.textContent = '';
+        setPlaying(true);
+        getContext().resume();
+        fill(generation);
+    };
+
+    const pause = () => {
+        resumePosition = position();
+        stopSources();
+        setPlaying(false);
+    };
+
+    // Seek the whole recording; only the segment containing `time` is downloaded
+    const seek = (time) => {
+        if (!manifest) {
+            return;
+        }
+        time = Math.min(Math.max(time, 0), manifest.duration);
+        if (playing) {
+            start(time);
+        } else {
+            resumePosition = time;
+            fetchSegment(segmentAt(time)).catch(() => {});
+        }
+        updateTime();
+    };
+    window.seekRecording = seek;
+
+    toggleButton.addEventListener('click', () => {
+        if (playing) {
+            pause();
+        } else {
+            start(resumePosition);
+        }
+    });
+
+    seekBar.addEventListener('input', () => { seeking = true; });
+    seekBar.addEventListener('change', () => {
+        seeking = false;
+        seek(parseFloat(seekBar.value));
+    });
+
+    // Links such as <a href="#" data-audio-seek="42"> (e.g. transcript timestamps) jump to that point
+    document.addEventListener('click', (e) => {
+        const link = e.target.closest('[data-audio-seek]');
+        if (link) {
+            e.preventDefault();
+            seek(parseFloat(link.dataset.audioSeek));
+        }
+    });
+
+    setInterval(updateTime, 250);
+
+    fetch(wrapper.dataset.manifest)
+        .then(response => response.json())
+        .then(data => {
+            manifest = data;
+            seekBar.max = manifest.duration;
+            toggleButton.disabled = false;
+            updateTime();
+            // A '#t=<seconds>' fragment starts from that point
+            const match = window.location.hash.match(/^#t=(\d+(?:\.\d+)?)$/);
+            if (match) {
+                seek(parseFloat(match[1]));
+            }
+        }).catch(error => {
+            console.log('Following error has occurred: ', error);
+            errorLabel.textContent = 'The recording could not be loaded.';
+        });
+});
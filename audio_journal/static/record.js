@@ -18,13 +18,17 @@ document.addEventListener('DOMContentLoaded', function () {
             };
 
             mediaRecorder.onstop = () => {
-                const blob = new Blob(chunks, { 'type': 'audio/ogg; codecs=opus' });
+                const type = mediaRecorder.mimeType || 'audio/ogg; codecs=opus';
+                const blob = new Blob(chunks, { 'type': type });
                 chunks = [];
                 audioURL = window.URL.createObjectURL(blob);
-                document.getElementById('audio_player').src = audioURL;
-                document.getElementById('audio_data').value = audioURL;
                 // Update the audio player source
                 audioPlayer.src = audioURL;
+                // Attach the recording to the form so the server can segment it
+                const extension = type.includes('webm') ? 'webm' : type.includes('mp4') ? 'm4a' : 'ogg';
+                const transfer = new DataTransfer();
+                transfer.items.add(new File([blob], 'recording.' + extension, { 'type': type }));
+                document.getElementById('audio_data').files = transfer.files;
             };
         }).catch(error => {
             console.log('Following error has occurred: ', error);